@@ -1,6 +1,5 @@
-import requests
-import ast
 import numpy as np
+from Precipitation_Frequency import rainfallQuantiles1To24Hour, rainfallQuantiles1To24HourAsync
 # import matplotlib.pyplot as plt
 
 # Retrieve the 2-year 2-hour rainfall amount, in inches, from the the NOAA Precipitation Frequency Data Server
@@ -8,25 +7,21 @@ import numpy as np
 def getRI2(lat, lon):
     # lat, lon are the coordinates of the drainage point
 
-    # Request data from NOAA
-    requestURL = "https://hdsc.nws.noaa.gov/cgi-bin/hdsc/new/cgi_readH5.py?lat={}&lon={}".format(lat, lon)
-    response = requests.get(requestURL)
-    if response.status_code == 200:
-        response_content = response.content.decode('utf-8')
-    else:
-        raise Exception("Request to NOAA data server failed")
-
-    # Extract the results from the response
-    data_string = response_content[response_content.index("quantiles = ")+len("quantiles = "):response_content.index("upper")-2] # String of data
-    data_lists = ast.literal_eval(data_string) # Convert string to list of lists
-    results = [list(map(float, sublist)) for sublist in data_lists] # Convert string values to floating point
+    # Get data from the offline grid, or request it from NOAA (or the on-disk cache of previous requests)
+    results = rainfallQuantiles1To24Hour(lat, lon)
 
     # Extract value corresponding to 2-hr duration storms and 2-year average recurrence interval
-    result_2hr_2yr = results[5][1]
+    result_2hr_2yr = results[1][1]
 
     # Return the 2-year 2-hour rainfall amount (inches)
     return result_2hr_2yr
 
+# Async version of getRI2
+async def getRI2Async(lat, lon):
+
+    results = await rainfallQuantiles1To24HourAsync(lat, lon)
+    return results[1][1]
+
 # Compute flood hydrographs for urban watersheds based on the Bohman 1992 method
 # Report: https://doi.org/10.3133/wri924040
 def computeUrbanFloodHydrographBohman1992(lat, lon, region3PercentArea, region4PercentArea, Qp, A, L, S, TIA):
@@ -0,0 +1,429 @@
+# Curve Number data for South Carolina watersheds, extracted from the statewide curve number raster (SC_RCN_LU_CO.tif)
+# Extraction does not touch the filesystem other than reading the raster, so weightedCurveNumber can run in several threads at once
+# The raster stays open and its decoded blocks are cached in memory, so repeated or overlapping watersheds are read from memory
+# Curve Number histograms are also cached on disk by watershed geometry, so resubmitted watersheds skip the raster entirely
+#
+# To convert the raster to an internally tiled, compressed Cloud-Optimized GeoTIFF with overviews, so only the tiles that
+# intersect a watershed are read (it is used instead of the original raster once it exists), run:
+#   python Curve_Number_Raster.py convert
+# To precompute the Curve Number histograms of raster tiles, so large watersheds only read the raster along their edges
+# (they are used once they exist, and must be rebuilt whenever the raster changes), run:
+#   python Curve_Number_Raster.py histograms
+# To check that concurrent extractions return the same results as serial ones, run:
+#   python Curve_Number_Raster.py check <watershed GeoJSON> [--threads 8] [--repetitions 64]
+# Without the histograms, very large watersheds can be split into tiles that are counted in parallel worker processes
+# (set CURVE_NUMBER_PARALLEL_WORKERS); to compare the parallel and serial extractions, run:
+#   python Curve_Number_Raster.py benchmark <watershed GeoJSON> [<watershed GeoJSON> ...] [--workers 4]
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import math
+import multiprocessing
+import numpy as np
+import os
+import pyproj
+import rasterio
+import rasterio.shutil
+import shapely
+import threading
+from affine import Affine
+from Disk_Cache import DiskLRUCache
+from Raster_Block_Cache import RasterBlockCache
+from rasterio.features import rasterize
+from rasterio.windows import Window
+from rasterstats import zonal_stats
+from rasterstats.io import bounds_window
+from shapely.geometry import shape
+
+## Download the SC_RCN_LU_CO_p.tif file
+# This file cannot be uploaded to the code repository due to large size
+# This file will be manually loaded to the FastAPI server
+# Please download SC_RCN_LU_CO_p.tif to the /assets folder: https://www.sciencebase.gov/catalog/item/6241fcc0d34e915b67eae16a
+# Or, run this code to download it programmatically:
+
+# sb = sciencebasepy.SbSession()
+# sbFiles = sb.get_item('6241fcc0d34e915b67eae16a')
+# sb.get_item_files(sbFiles, "assets")
+# os.remove("/assets/SC_RCN_LU_CO.tif-ColorRamp.SLD")
+# os.remove("/assets/SC_RCN_LU.PNG")
+# os.remove("/assets/SC_RCN.xml")
+
+# Location of the curve number raster and its Cloud-Optimized GeoTIFF conversion; can be set with environment variables
+CURVE_NUMBER_RASTER_PATH = os.environ.get("CURVE_NUMBER_RASTER_PATH", "assets/SC_RCN_LU_CO.tif")
+CURVE_NUMBER_COG_PATH = os.environ.get("CURVE_NUMBER_COG_PATH", "assets/SC_RCN_LU_CO_cog.tif")
+
+# Size (cells) of the square tiles of the Cloud-Optimized GeoTIFF
+COG_BLOCK_SIZE = 512
+
+# Location of the Curve Number histogram pyramid built by buildCurveNumberHistograms; can be set with an environment variable
+CURVE_NUMBER_HISTOGRAMS_PATH = os.environ.get("CURVE_NUMBER_HISTOGRAMS_PATH", "assets/SC_RCN_LU_CO_histograms.npy")
+
+# Size (cells) of the square tiles of the finest histogram level; each coarser level combines 4 x 4 tiles of the level below
+HISTOGRAM_TILE_SIZE = COG_BLOCK_SIZE
+HISTOGRAM_LEVELS = 3
+
+# Histograms count the cells with each value from 0 to 255 (Curve Numbers are 0 to 100)
+CURVE_NUMBER_BINS = 256
+
+# Number of worker processes for parallel extraction of very large watersheds (0 disables it), and the size (number of cells in the bounding box)
+# of the smallest watershed that is extracted in parallel; can be set with environment variables
+# Each worker has its own raster block cache; the workers share CURVE_NUMBER_BLOCK_CACHE_MB between them, so decoded blocks take at most
+# twice CURVE_NUMBER_BLOCK_CACHE_MB in total (the main process and all workers)
+CURVE_NUMBER_PARALLEL_WORKERS = int(os.environ.get("CURVE_NUMBER_PARALLEL_WORKERS", "0"))
+CURVE_NUMBER_PARALLEL_MIN_CELLS = int(os.environ.get("CURVE_NUMBER_PARALLEL_MIN_CELLS", "4000000"))
+
+# Size (cells) of the square tiles counted by each parallel task; a multiple of the Cloud-Optimized GeoTIFF tiles
+PARALLEL_TILE_SIZE = 4 * COG_BLOCK_SIZE
+
+# Memory budget (megabytes) for the decoded blocks of the curve number raster; can be set with an environment variable
+CURVE_NUMBER_BLOCK_CACHE_MB = float(os.environ.get("CURVE_NUMBER_BLOCK_CACHE_MB", "256"))
+
+# Location and size limit (number of watersheds) of the on-disk cache of Curve Number histograms; can be set with environment variables
+curve_number_histogram_cache = DiskLRUCache(
+    os.environ.get("CURVE_NUMBER_CACHE_PATH", "cache/curve_number_histograms.sqlite"),
+    int(os.environ.get("CURVE_NUMBER_CACHE_MAX_ENTRIES", "10000"))
+)
+
+curve_number_raster = RasterBlockCache(
+    CURVE_NUMBER_COG_PATH if os.path.exists(CURVE_NUMBER_COG_PATH) else CURVE_NUMBER_RASTER_PATH,
+    int(CURVE_NUMBER_BLOCK_CACHE_MB * 1024 * 1024)
+)
+
+# Convert the curve number raster to an internally tiled, DEFLATE-compressed Cloud-Optimized GeoTIFF with overviews
+# The original raster is organized in strips that span the whole state, so a watershed reads every strip it crosses from edge to edge;
+# tiles limit reads to the area around the watershed. Cell values are unchanged
+def convertCurveNumberRaster(input_path=CURVE_NUMBER_RASTER_PATH, output_path=CURVE_NUMBER_COG_PATH):
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Curve Numbers are categories, so overviews use the most common value instead of an average
+    rasterio.shutil.copy(input_path, output_path, driver="COG", blocksize=COG_BLOCK_SIZE, compress="DEFLATE", predictor="YES",
+                         overview_resampling="MODE", bigtiff="IF_SAFER", num_threads="ALL_CPUS")
+
+    with rasterio.open(input_path) as input_raster, rasterio.open(output_path) as output_raster:
+        if (output_raster.width, output_raster.height, output_raster.transform, output_raster.nodata) != (input_raster.width, input_raster.height, input_raster.transform, input_raster.nodata):
+            raise Exception("Converted curve number raster does not match {}".format(input_path))
+
+# Build the Curve Number histogram of each HISTOGRAM_TILE_SIZE x HISTOGRAM_TILE_SIZE tile of the raster, counting the cells with each value except nodata
+# Histograms are stored as a (tile rows, tile columns, CURVE_NUMBER_BINS) array of cell counts, with the raster georeferencing next to it
+def buildCurveNumberHistograms(raster_path=None, output_path=CURVE_NUMBER_HISTOGRAMS_PATH):
+    raster_path = curve_number_raster.path if raster_path is None else raster_path
+
+    with rasterio.open(raster_path) as raster:
+        if raster.dtypes[0] != "uint8":
+            raise Exception("Curve number histograms require an 8-bit raster")
+        tile_rows = math.ceil(raster.height / HISTOGRAM_TILE_SIZE)
+        tile_columns = math.ceil(raster.width / HISTOGRAM_TILE_SIZE)
+        histograms = np.zeros((tile_rows, tile_columns, CURVE_NUMBER_BINS), dtype=np.uint32)
+        for tile_row in range(tile_rows):
+            # Read one row of tiles at a time
+            row_offset = tile_row * HISTOGRAM_TILE_SIZE
+            values = raster.read(1, window=Window(0, row_offset, raster.width, min(HISTOGRAM_TILE_SIZE, raster.height - row_offset)))
+            for tile_column in range(tile_columns):
+                tile = values[:, tile_column * HISTOGRAM_TILE_SIZE:(tile_column + 1) * HISTOGRAM_TILE_SIZE]
+                if raster.nodata is not None:
+                    tile = tile[tile != raster.nodata]
+                histograms[tile_row, tile_column] = np.bincount(tile.ravel(), minlength=CURVE_NUMBER_BINS)
+        header = {
+            "tile_size": HISTOGRAM_TILE_SIZE,
+            "transform": list(raster.transform)[:6],
+            "height": raster.height,
+            "width": raster.width,
+            "nodata": raster.nodata
+        }
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    np.save(output_path, histograms)
+    with open(os.path.splitext(output_path)[0] + ".json", "w") as header_file:
+        json.dump(header, header_file)
+
+# Load the histograms built by buildCurveNumberHistograms and sum them into HISTOGRAM_LEVELS levels, finest first
+# Returns None if they have not been built
+def loadCurveNumberHistograms(path=CURVE_NUMBER_HISTOGRAMS_PATH):
+    header_path = os.path.splitext(path)[0] + ".json"
+    if not (os.path.exists(path) and os.path.exists(header_path)):
+        return None
+    with open(header_path) as header_file:
+        header = json.load(header_file)
+
+    levels = [np.load(path, mmap_mode="r")]
+    for level in range(1, HISTOGRAM_LEVELS):
+        finer_level = levels[-1]
+        tile_rows = math.ceil(finer_level.shape[0] / 4)
+        tile_columns = math.ceil(finer_level.shape[1] / 4)
+        padded_level = np.zeros((tile_rows * 4, tile_columns * 4, CURVE_NUMBER_BINS), dtype=np.uint32)
+        padded_level[:finer_level.shape[0], :finer_level.shape[1]] = finer_level
+        levels.append(padded_level.reshape(tile_rows, 4, tile_columns, 4, CURVE_NUMBER_BINS).sum(axis=(1, 3), dtype=np.uint32))
+    return header, levels
+
+curve_number_histograms = loadCurveNumberHistograms()
+
+# Returns the Curve Number histogram of the geometry (EPSG 2273), using the histogram pyramid
+# Cells are selected exactly as zonal_stats selects them, so the counts are identical; tiles that are entirely in the geometry
+# are counted from their histograms, and only tiles along the edge of the geometry are rasterized and read from the raster
+# Whether a tile is entirely in, outside, or along the edge of the geometry is decided from the rectangle spanning its cell centers,
+# so the work grows with the perimeter of the geometry rather than the area of its bounding box
+def pyramidHistogram(geometry):
+    header, levels = curve_number_histograms
+    transform = curve_number_raster.transform
+    height, width = curve_number_raster.shape
+    nodata = curve_number_raster.nodata
+    if (header["height"], header["width"], Affine(*header["transform"])) != (height, width, transform):
+        raise Exception("Curve number histograms do not match the curve number raster; rebuild them with: python Curve_Number_Raster.py histograms")
+
+    # Window of raster cells that covers the geometry
+    (row_start, row_stop), (column_start, column_stop) = bounds_window(geometry.bounds, transform)
+    shapely.prepare(geometry)
+
+    # Rectangle spanning the centers of the cells in rows [first_row, last_row) and columns [first_column, last_column)
+    def cellCenters(first_row, last_row, first_column, last_column):
+        x1, y1 = transform * (first_column + 0.5, first_row + 0.5)
+        x2, y2 = transform * (last_column - 0.5, last_row - 0.5)
+        return shapely.box(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
+    counts = np.zeros(CURVE_NUMBER_BINS, dtype=np.int64)
+
+    def addTiles(level, tile_rows, tile_columns):
+        tile_size = header["tile_size"] * 4 ** level
+        for tile_row in tile_rows:
+            tile_row_start = tile_row * tile_size
+            tile_row_stop = min(tile_row_start + tile_size, height)
+            first_row = max(tile_row_start, row_start)
+            last_row = min(tile_row_stop, row_stop)
+            if first_row >= last_row:
+                continue
+            for tile_column in tile_columns:
+                tile_column_start = tile_column * tile_size
+                tile_column_stop = min(tile_column_start + tile_size, width)
+                first_column = max(tile_column_start, column_start)
+                last_column = min(tile_column_stop, column_stop)
+                if first_column >= last_column:
+                    continue
+
+                # No cell center of the tile (within the window) can be in the geometry
+                if not shapely.intersects(geometry, cellCenters(first_row, last_row, first_column, last_column)):
+                    continue
+                if shapely.contains_properly(geometry, cellCenters(tile_row_start, tile_row_stop, tile_column_start, tile_column_stop)):
+                    counts[:] += levels[level][tile_row, tile_column]
+                elif level > 0:
+                    addTiles(level - 1, range(tile_row * 4, tile_row * 4 + 4), range(tile_column * 4, tile_column * 4 + 4))
+                else:
+                    # Cells of the edge tile whose centers are in the geometry; only the part of the geometry around the tile is rasterized
+                    tile_transform = transform * Affine.translation(first_column, first_row)
+                    tile_geometry = shapely.clip_by_rect(geometry, *cellCenters(first_row - 1, last_row + 1, first_column - 1, last_column + 1).bounds)
+                    if tile_geometry.is_empty:
+                        continue
+                    tile_mask = rasterize([(tile_geometry, 1)], out_shape=(last_row - first_row, last_column - first_column), transform=tile_transform, fill=0, dtype="uint8").astype(bool)
+                    values = curve_number_raster.readWindow(first_row, last_row, first_column, last_column)[tile_mask]
+                    if nodata is not None:
+                        values = values[values != nodata]
+                    counts[:] += np.bincount(values, minlength=CURVE_NUMBER_BINS)
+
+    top_level = len(levels) - 1
+    top_tile_size = header["tile_size"] * 4 ** top_level
+    addTiles(top_level,
+             range(max(row_start, 0) // top_tile_size, math.ceil(min(row_stop, height) / top_tile_size)),
+             range(max(column_start, 0) // top_tile_size, math.ceil(min(column_stop, width) / top_tile_size)))
+
+    return counts
+
+# Returns the Curve Number histogram of the geometry (EPSG 2273), using zonal_stats on the raster blocks that cover it
+def zonalHistogram(geometry):
+    # Read the raster blocks that cover the watershed (from memory if they are cached)
+    values, transform = curve_number_raster.read(geometry.bounds)
+    result = zonal_stats(geometry, values, affine=transform, nodata=curve_number_raster.nodata, stats="unique", categorical=True)[0]
+
+    counts = np.zeros(CURVE_NUMBER_BINS, dtype=np.int64)
+    for curveNumber in result:
+        if (curveNumber != 'unique'):
+            counts[int(curveNumber)] += result[curveNumber]
+    return counts
+
+# Transforms WGS84 coordinates to the coordinate system of SC_RCN_LU_CO_p.tif (NAD_1983_StatePlane_South_Carolina_FIPS_3900_Feet_Intl; EPSG 2273)
+# Created once because creating a transformer is slow; transformers can be shared between threads
+watershed_transformer = pyproj.Transformer.from_crs(4326, 2273, always_xy=True)
+
+# Returns the Curve Number histogram of the cells in rows row_start to row_stop - 1 and columns column_start to column_stop - 1
+# whose centers are in the geometry (EPSG 2273); the window must be inside the raster
+def tileHistogram(geometry, row_start, row_stop, column_start, column_stop):
+    transform = curve_number_raster.transform
+    nodata = curve_number_raster.nodata
+    west, north = transform * (column_start, row_start)
+    tile_transform = Affine(transform.a, transform.b, west, transform.d, transform.e, north)
+    mask = rasterize([(geometry, 1)], out_shape=(row_stop - row_start, column_stop - column_start), transform=tile_transform, fill=0, dtype="uint8").astype(bool)
+
+    counts = np.zeros(CURVE_NUMBER_BINS, dtype=np.int64)
+    if mask.any():
+        values = curve_number_raster.readWindow(row_start, row_stop, column_start, column_stop)[mask]
+        if nodata is not None:
+            values = values[values != nodata]
+        counts += np.bincount(values, minlength=CURVE_NUMBER_BINS)
+    return counts
+
+# Worker processes for parallelHistogram, started the first time they are needed
+# Workers are started with "spawn" so they open the raster themselves instead of inheriting open dataset handles
+parallel_executor = None
+parallel_executor_lock = threading.Lock()
+
+def parallelExecutor(workers):
+    global parallel_executor
+    with parallel_executor_lock:
+        if parallel_executor is None:
+            parallel_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=setBlockCacheSize,
+                initargs=(int(CURVE_NUMBER_BLOCK_CACHE_MB * 1024 * 1024 / workers),)
+            )
+        return parallel_executor
+
+# Runs in each worker process: limit its raster block cache to its share of CURVE_NUMBER_BLOCK_CACHE_MB
+def setBlockCacheSize(max_bytes):
+    curve_number_raster.max_bytes = max_bytes
+
+# Returns the number of raster cells in the bounding box of the geometry (EPSG 2273)
+def boundingBoxCells(geometry):
+    west, south, east, north = geometry.bounds
+    transform = curve_number_raster.transform
+    return (east - west) * (north - south) / abs(transform.a * transform.e)
+
+# Returns the Curve Number histogram of the geometry (EPSG 2273), splitting the bounding box into tiles aligned to the raster tiles
+# and counting the tiles that intersect the geometry in worker processes
+# Each tile selects its cells exactly as zonal_stats selects them, so the counts are identical to zonalHistogram
+def parallelHistogram(geometry, workers=CURVE_NUMBER_PARALLEL_WORKERS):
+    transform = curve_number_raster.transform
+    height, width = curve_number_raster.shape
+    (row_start, row_stop), (column_start, column_stop) = bounds_window(geometry.bounds, transform)
+    row_start, row_stop = max(row_start, 0), min(row_stop, height)
+    column_start, column_stop = max(column_start, 0), min(column_stop, width)
+
+    tiles = []
+    for tile_row_start in range(row_start - row_start % PARALLEL_TILE_SIZE, row_stop, PARALLEL_TILE_SIZE):
+        for tile_column_start in range(column_start - column_start % PARALLEL_TILE_SIZE, column_stop, PARALLEL_TILE_SIZE):
+            tile = (max(tile_row_start, row_start), min(tile_row_start + PARALLEL_TILE_SIZE, row_stop),
+                    max(tile_column_start, column_start), min(tile_column_start + PARALLEL_TILE_SIZE, column_stop))
+            # Skip tiles that are entirely outside the geometry
+            west, north = transform * (tile[2], tile[0])
+            east, south = transform * (tile[3], tile[1])
+            if shapely.intersects(geometry, shapely.box(west, south, east, north)):
+                tiles.append(tile)
+
+    counts = np.zeros(CURVE_NUMBER_BINS, dtype=np.int64)
+    for tile_counts in parallelExecutor(workers).map(tileHistogram, [geometry] * len(tiles), *zip(*tiles)):
+        counts += tile_counts
+    return counts
+
+# Reproject the watershed features to the same coordinate system as SC_RCN_LU_CO_p.tif
+# The coordinates of all features are transformed with a single call; returns an array of Shapely geometries
+def watershedGeometries(watershedFeatures):
+    geometries = [shape(feature["geometry"]) for feature in watershedFeatures]
+    return shapely.transform(geometries, lambda coordinates: np.column_stack(watershed_transformer.transform(coordinates[:, 0], coordinates[:, 1])))
+
+# Returns a key that identifies the watershed geometry and the curve number raster
+# Geometries are normalized, so the same watershed has the same key regardless of ring orientation, starting vertex, or feature order
+def watershedCacheKey(watershedFeatures):
+    geometry_hashes = sorted(hashlib.sha256(shapely.to_wkb(shapely.normalize(shape(feature["geometry"])))).hexdigest() for feature in watershedFeatures)
+    raster_status = os.stat(curve_number_raster.path)
+    return hashlib.sha256(json.dumps([curve_number_raster.path, raster_status.st_size, raster_status.st_mtime_ns, geometry_hashes]).encode()).hexdigest()
+
+# Returns the Curve Number histogram of the watershed: an array of the number of curve number raster cells in the watershed, indexed by Curve Number
+# The histogram is read from the on-disk cache if the same watershed has been extracted before
+def curveNumberHistogram(watershedFeatures):
+    # watershedFeatures: list of "features" of delineated watershed returned by StreamStatsServices
+
+    cache_key = watershedCacheKey(watershedFeatures)
+    cached_counts = curve_number_histogram_cache.get(cache_key)
+    if cached_counts is not None:
+        counts = np.zeros(CURVE_NUMBER_BINS, dtype=np.int64)
+        for curveNumber, count in cached_counts:
+            counts[curveNumber] = count
+        return counts
+
+    counts = extractCurveNumberHistogram(watershedFeatures)
+    curve_number_histogram_cache.put(cache_key, [[curveNumber, count] for curveNumber, count in enumerate(counts.tolist()) if count > 0])
+    return counts
+
+# Extracts the Curve Number histogram of the watershed from the raster (or the histogram pyramid), without the on-disk cache
+def extractCurveNumberHistogram(watershedFeatures):
+    counts = np.zeros(CURVE_NUMBER_BINS, dtype=np.int64)
+    for geometry in watershedGeometries(watershedFeatures):
+        if curve_number_histograms is not None:
+            counts += pyramidHistogram(geometry)
+        elif CURVE_NUMBER_PARALLEL_WORKERS > 0 and curve_number_raster.dtype == "uint8" and boundingBoxCells(geometry) >= CURVE_NUMBER_PARALLEL_MIN_CELLS:
+            counts += parallelHistogram(geometry)
+        else:
+            counts += zonalHistogram(geometry)
+
+    return counts
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="Prepare and check the curve number raster")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="convert the raster to a Cloud-Optimized GeoTIFF")
+    convert_parser.add_argument("--input", default=CURVE_NUMBER_RASTER_PATH, help="curve number raster (default: %(default)s)")
+    convert_parser.add_argument("--output", default=CURVE_NUMBER_COG_PATH, help="output Cloud-Optimized GeoTIFF (default: %(default)s)")
+    histograms_parser = subparsers.add_parser("histograms", help="precompute the Curve Number histograms of raster tiles")
+    histograms_parser.add_argument("--raster", default=None, help="curve number raster (default: the raster used by weightedCurveNumber)")
+    histograms_parser.add_argument("--output", default=CURVE_NUMBER_HISTOGRAMS_PATH, help="output .npy file (default: %(default)s)")
+    check_parser = subparsers.add_parser("check", help="check that concurrent curve number extractions match serial ones")
+    check_parser.add_argument("watershed", help="GeoJSON file with the watershed features")
+    check_parser.add_argument("--threads", type=int, default=8, help="number of concurrent threads (default: %(default)s)")
+    check_parser.add_argument("--repetitions", type=int, default=64, help="number of concurrent extractions (default: %(default)s)")
+    benchmark_parser = subparsers.add_parser("benchmark", help="compare parallel and serial extractions of watersheds")
+    benchmark_parser.add_argument("watersheds", nargs="+", help="GeoJSON files with the watershed features")
+    benchmark_parser.add_argument("--workers", type=int, default=max(CURVE_NUMBER_PARALLEL_WORKERS, 4), help="number of worker processes (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convertCurveNumberRaster(args.input, args.output)
+
+    elif args.command == "histograms":
+        buildCurveNumberHistograms(args.raster, args.output)
+
+    elif args.command == "check":
+        with open(args.watershed) as watershed_file:
+            watershedFeatures = json.load(watershed_file)["features"]
+
+        start = time.perf_counter()
+        expected = extractCurveNumberHistogram(watershedFeatures)
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(args.threads) as executor:
+            results = list(executor.map(lambda repetition: extractCurveNumberHistogram(watershedFeatures), range(args.repetitions)))
+        concurrent_time = time.perf_counter() - start
+
+        mismatches = sum(not np.array_equal(result, expected) for result in results)
+        print("{} extractions in {} threads: {} mismatches; serial {:.1f} ms per extraction, concurrent {:.1f} ms per extraction".format(
+            args.repetitions, args.threads, mismatches, serial_time * 1e3, concurrent_time * 1e3 / args.repetitions))
+        if mismatches:
+            raise Exception("Concurrent extractions do not match the serial extraction")
+
+    elif args.command == "benchmark":
+        for watershed_path in args.watersheds:
+            with open(watershed_path) as watershed_file:
+                geometries = watershedGeometries(json.load(watershed_file)["features"])
+
+            # Read the raster blocks into memory, and start the workers and read them into their memory, before timing
+            zonalHistogram(geometries[0])
+            parallelHistogram(geometries[0], args.workers)
+
+            start = time.perf_counter()
+            serial_counts = sum(zonalHistogram(geometry) for geometry in geometries)
+            serial_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            parallel_counts = sum(parallelHistogram(geometry, args.workers) for geometry in geometries)
+            parallel_time = time.perf_counter() - start
+
+            if not np.array_equal(serial_counts, parallel_counts):
+                raise Exception("Parallel extraction does not match the serial extraction for {}".format(watershed_path))
+            print("{}: {:.1f} square miles, serial {:.0f} ms, parallel ({} workers) {:.0f} ms ({:.1f}x faster)".format(
+                watershed_path, serial_counts.sum() * 900.0 / 27878400, serial_time * 1e3, args.workers, parallel_time * 1e3, serial_time / parallel_time))
@@ -0,0 +1,81 @@
+# Persistent key-value cache stored in a SQLite database file
+# Entries are JSON-encoded and evicted in least-recently-used order once the cache holds more than max_entries
+# Reads do not write to the database: last-used times are kept in memory and written in batches, and always before entries are evicted
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class DiskLRUCache:
+    # path: location of the SQLite database file; parent directories are created as needed
+    # max_entries: maximum number of entries kept on disk (int)
+    # flush_entries, flush_interval: last-used times are written once this many entries have been read or this many seconds have passed
+
+    def __init__(self, path, max_entries, flush_entries=1000, flush_interval=60):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_entries = flush_entries
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._last_flush = time.monotonic()
+
+    def _connect(self):
+        # Open the database the first time it is used so importing this module never touches the filesystem
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)")
+            self._connection.commit()
+        return self._connection
+
+    # Returns the cached value for key, or None if it is not in the cache
+    def get(self, key):
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._last_used[key] = time.time()
+            if len(self._last_used) >= self.flush_entries or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flushLastUsed(connection)
+                connection.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    # Stores value (any JSON-serializable object) under key, evicting the least recently used entries beyond max_entries
+    def put(self, key, value):
+        with self._lock:
+            connection = self._connect()
+            self._flushLastUsed(connection)
+            connection.execute("INSERT OR REPLACE INTO cache (key, value, last_used) VALUES (?, ?, ?)", (key, json.dumps(value), time.time()))
+            connection.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            connection.commit()
+
+    # Write the last-used times of entries read since the last flush; the caller holds the lock and commits
+    def _flushLastUsed(self, connection):
+        if self._last_used:
+            connection.executemany("UPDATE cache SET last_used = ? WHERE key = ?", [(last_used, key) for key, last_used in self._last_used.items()])
+            self._last_used = {}
+        self._last_flush = time.monotonic()
+
+    # Returns hit and miss counts since the process started
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0
+        }
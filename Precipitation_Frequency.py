@@ -0,0 +1,99 @@
+# Retrieve precipitation frequency estimates from the NOAA Precipitation Frequency Data Server
+# https://hdsc.nws.noaa.gov/hdsc/pfds/pfds_map_cont.html?bkmrk=sc
+# NOAA Atlas 14 estimates never change for a given grid cell, so results are cached on disk by grid cell (see atlas14CellKey in Rainfall_Grid.py)
+# and shared by rainfallData (SC_Synthetic_UH_Method.py) and getRI2 (Bohman_Method_1992.py)
+# If the offline grid has been built (see Rainfall_Grid.py), it is used instead and the data server is only a fallback
+
+import asyncio
+import numpy as np
+import os
+from Disk_Cache import DiskLRUCache
+from Precipitation_Frequency_Parser import parsePrecipitationFrequencyResponse
+from Rainfall_Grid import atlas14CellKey, offlineRainfallQuantiles
+from Upstream_Client import singleFlight, singleFlightAsync, upstreamGet, upstreamGetAsync
+
+# Location and size limit (number of grid cells) of the on-disk cache; can be set with environment variables
+rainfall_quantile_cache = DiskLRUCache(
+    os.environ.get("RAINFALL_CACHE_PATH", "cache/rainfall_quantiles.sqlite"),
+    int(os.environ.get("RAINFALL_CACHE_MAX_ENTRIES", "100000"))
+)
+
+# Returns the precipitation frequency estimates (inches) for the coordinate point, as a float array
+# Rows correspond to storm durations 1, 2, 3, 6, 12, 24 hours; columns correspond to average recurrence intervals 1, 2, 5, 10, 25, 50, 100, 200, 500, 1000 years
+def rainfallQuantiles1To24Hour(lat, lon):
+    quantiles = offlineRainfallQuantiles(lat, lon)
+    if quantiles is None:
+        quantiles = precipitationFrequencyQuantiles(lat, lon)[4:10]
+    return quantiles
+
+# Async version of rainfallQuantiles1To24Hour
+async def rainfallQuantiles1To24HourAsync(lat, lon):
+    quantiles = offlineRainfallQuantiles(lat, lon)
+    if quantiles is None:
+        quantiles = (await precipitationFrequencyQuantilesAsync(lat, lon))[4:10]
+    return quantiles
+
+# Returns the full NOAA "quantiles" matrix for the coordinate point, from the cache if available
+# Rows correspond to storm durations: 5-min, 10-min, 15-min, 30-min, 60-min, 2-hr, 3-hr, 6-hr, 12-hr, 24-hr, 2-day, 3-day, 4-day, 7-day, 10-day, 20-day, 30-day, 45-day, 60-day
+# Columns correspond to average recurrence interval (years): 1, 2, 5, 10, 25, 50, 100, 200, 500, 1000
+def precipitationFrequencyQuantiles(lat, lon):
+    return precipitationFrequencyEstimates(lat, lon)["quantiles"]
+
+# Async version of precipitationFrequencyQuantiles
+async def precipitationFrequencyQuantilesAsync(lat, lon):
+    return (await precipitationFrequencyEstimatesAsync(lat, lon))["quantiles"]
+
+# Returns the NOAA "quantiles" matrix and the "upper" and "lower" bounds of its 90% confidence intervals for the coordinate point, from the cache if available
+# Concurrent lookups in the same grid cell share a single request to the data server
+def precipitationFrequencyEstimates(lat, lon):
+    cache_key = atlas14CellKey(lat, lon)
+    estimates = rainfall_quantile_cache.get(cache_key)
+    if estimates is None:
+        return singleFlight(("precipitation_frequency", cache_key), requestAndCachePrecipitationFrequencyEstimates, lat, lon, cache_key)
+    return {name: np.array(matrix) for name, matrix in estimates.items()}
+
+# Async version of precipitationFrequencyEstimates
+# The cache is read and written in a worker thread, so a busy SQLite database never blocks the event loop
+async def precipitationFrequencyEstimatesAsync(lat, lon):
+    cache_key = atlas14CellKey(lat, lon)
+    estimates = await asyncio.to_thread(rainfall_quantile_cache.get, cache_key)
+    if estimates is None:
+        return await singleFlightAsync(("precipitation_frequency", cache_key), requestAndCachePrecipitationFrequencyEstimatesAsync, lat, lon, cache_key)
+    return {name: np.array(matrix) for name, matrix in estimates.items()}
+
+def requestAndCachePrecipitationFrequencyEstimates(lat, lon, cache_key):
+    estimates = requestPrecipitationFrequencyEstimates(lat, lon)
+    rainfall_quantile_cache.put(cache_key, {name: matrix.tolist() for name, matrix in estimates.items()})
+    return estimates
+
+async def requestAndCachePrecipitationFrequencyEstimatesAsync(lat, lon, cache_key):
+    estimates = await requestPrecipitationFrequencyEstimatesAsync(lat, lon)
+    await asyncio.to_thread(rainfall_quantile_cache.put, cache_key, {name: matrix.tolist() for name, matrix in estimates.items()})
+    return estimates
+
+def precipitationFrequencyURL(lat, lon):
+    return "https://hdsc.nws.noaa.gov/cgi-bin/hdsc/new/cgi_readH5.py?lat={}&lon={}".format(lat, lon)
+
+# Request the precipitation frequency estimates for the coordinate point from the NOAA data server
+def requestPrecipitationFrequencyEstimates(lat, lon):
+
+    # Request data from NOAA
+    response = upstreamGet(precipitationFrequencyURL(lat, lon))
+    if response.status_code == 200:
+        response_content = response.content.decode('utf-8')
+    else:
+        raise Exception("Request to NOAA data server failed")
+
+    return parsePrecipitationFrequencyResponse(response_content)
+
+# Async version of requestPrecipitationFrequencyEstimates
+async def requestPrecipitationFrequencyEstimatesAsync(lat, lon):
+
+    # Request data from NOAA
+    response = await upstreamGetAsync(precipitationFrequencyURL(lat, lon))
+    if response.status_code == 200:
+        response_content = response.content.decode('utf-8')
+    else:
+        raise Exception("Request to NOAA data server failed")
+
+    return parsePrecipitationFrequencyResponse(response_content)
@@ -0,0 +1,76 @@
+# Parser for responses from the NOAA Precipitation Frequency Data Server (cgi_readH5.py)
+# The response is JavaScript-like text, e.g.
+#   quantiles = [['0.443', '0.529', ...], ['0.706', '0.845', ...], ...];
+#   upper = [[...]];
+#   lower = [[...]];
+# The "quantiles" matrix holds the precipitation frequency estimates; "upper" and "lower" hold the bounds of their 90% confidence intervals
+#
+# To check the parser against the previous parser and benchmark both on responses saved from the data server, run:
+#   python Precipitation_Frequency_Parser.py [<response file> ...]
+# Without arguments, fixtures/noaa_pfds_response.txt is used; it has the data server's format and synthetic estimates for the example drainage point
+
+import ast
+import numpy as np
+import os
+import re
+
+# Matches each matrix in the response: name = [[...]];
+matrix_pattern = re.compile(r"(quantiles|upper|lower) = (\[\[[^;]*\]\]);")
+
+# Separates the rows of a matrix, once its outer brackets are removed
+row_separator_pattern = re.compile(r"\]\s*,\s*\[")
+
+# Quotes removed from a row so only comma-separated numbers remain
+quote_characters = str.maketrans("", "", "'\"")
+
+RESPONSE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "noaa_pfds_response.txt")
+
+# Extract the "quantiles", "upper", and "lower" matrices from the response as float arrays
+# Raises an exception if a matrix has rows of different lengths or a value that is not a positive number, so a malformed response is never cached
+# Rows correspond to storm durations: 5-min, 10-min, 15-min, 30-min, 60-min, 2-hr, 3-hr, 6-hr, 12-hr, 24-hr, 2-day, 3-day, 4-day, 7-day, 10-day, 20-day, 30-day, 45-day, 60-day
+# Columns correspond to average recurrence interval (years): 1, 2, 5, 10, 25, 50, 100, 200, 500, 1000
+def parsePrecipitationFrequencyResponse(response_content):
+    matrices = {}
+    for match in matrix_pattern.finditer(response_content):
+        rows = [row.translate(quote_characters).split(",") for row in row_separator_pattern.split(match.group(2)[2:-2])]
+        if any(len(row) != len(rows[0]) for row in rows):
+            raise Exception("Response from NOAA data server contains a malformed {} matrix".format(match.group(1)))
+        try:
+            values = np.array(rows, dtype=np.float64) # raises ValueError for empty or non-numeric values
+        except ValueError:
+            raise Exception("Response from NOAA data server contains a malformed {} matrix".format(match.group(1)))
+        if not np.all(values > 0): # also rejects NaN
+            raise Exception("Response from NOAA data server contains invalid {} values".format(match.group(1)))
+        matrices[match.group(1)] = values
+
+    if "quantiles" not in matrices:
+        raise Exception("Response from NOAA data server does not contain precipitation frequency estimates")
+
+    return matrices
+
+# Previous parser, kept as the reference for the benchmark
+def parseQuantilesLiteralEval(response_content):
+    data_string = response_content[response_content.index("quantiles = ")+len("quantiles = "):response_content.index("upper")-2] # String of data
+    data_lists = ast.literal_eval(data_string) # Convert string to list of lists
+    results = [list(map(float, sublist)) for sublist in data_lists] # Convert string values to floating point
+
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    import timeit
+
+    for response_path in sys.argv[1:] or [RESPONSE_PATH]:
+        with open(response_path) as response_file:
+            response_content = response_file.read()
+
+        # Check that both parsers agree before timing them
+        if not np.array_equal(parsePrecipitationFrequencyResponse(response_content)["quantiles"], np.array(parseQuantilesLiteralEval(response_content))):
+            raise Exception("Parsers disagree for {}".format(response_path))
+
+        repetitions = 2000
+        literal_eval_time = timeit.timeit(lambda: parseQuantilesLiteralEval(response_content), number=repetitions) / repetitions
+        parser_time = timeit.timeit(lambda: parsePrecipitationFrequencyResponse(response_content), number=repetitions) / repetitions
+        print("{}: ast.literal_eval {:.1f} us, parsePrecipitationFrequencyResponse {:.1f} us ({:.1f}x faster)".format(
+            response_path, literal_eval_time * 1e6, parser_time * 1e6, literal_eval_time / parser_time))
@@ -0,0 +1,76 @@
+# Rainfall distribution curves (P/P1 at 6-minute intervals, see Rainfall_Data_Curves.py) stored as one contiguous float64 array
+# with a table of the offsets of each curve and D-hour storm
+# The array is memory-mapped the first time a curve is needed, and rainfallCurve returns views of it, so no Python floats are created
+# If the array file has not been built, the curves are read from Rainfall_Data_Curves.py instead
+#
+# To rebuild the array file after changing Rainfall_Data_Curves.py, run:
+#   python Rainfall_Curves.py
+
+import argparse
+import json
+import numpy as np
+import os
+import threading
+
+# Location of the array file; can be set with an environment variable
+RAINFALL_CURVES_PATH = os.environ.get("RAINFALL_CURVES_PATH", "assets/SC_rainfall_data_curves.npy")
+
+# Concatenate the curves of Rainfall_Data_Curves.py
+# Returns the offset table ({curve letter: {D: [start, stop]}}) and the array of all curves
+def concatenateRainfallCurves():
+    from Rainfall_Data_Curves import rainfall_data_curves
+
+    offsets = {}
+    values = []
+    size = 0
+    for curve, durations in rainfall_data_curves.items():
+        offsets[curve] = {}
+        for D, curve_values in durations.items():
+            offsets[curve][str(D)] = [size, size + len(curve_values)]
+            values += curve_values
+            size += len(curve_values)
+    return offsets, np.array(values, dtype=np.float64)
+
+# Save the curves as an array file and its offset table next to it
+def buildRainfallCurves(output_path=RAINFALL_CURVES_PATH):
+    offsets, values = concatenateRainfallCurves()
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    np.save(output_path, values)
+    with open(os.path.splitext(output_path)[0] + ".json", "w") as header_file:
+        json.dump(offsets, header_file, indent=4)
+
+# Memory-map the array file built by buildRainfallCurves; falls back to Rainfall_Data_Curves.py if it has not been built
+def loadRainfallCurves(path=RAINFALL_CURVES_PATH):
+    header_path = os.path.splitext(path)[0] + ".json"
+    if not (os.path.exists(path) and os.path.exists(header_path)):
+        return concatenateRainfallCurves()
+    with open(header_path) as header_file:
+        offsets = json.load(header_file)
+    return offsets, np.load(path, mmap_mode="r")
+
+# Loaded by the first call to rainfallCurve
+rainfall_curves = None
+rainfall_curves_lock = threading.Lock()
+
+# Returns the P/P1 values of the rainfall distribution curve ("II", "III", "A", "B", "C", "D") for the D-hour storm at 6-minute intervals,
+# as a read-only float array view
+def rainfallCurve(curve, D):
+    global rainfall_curves
+    if rainfall_curves is None:
+        with rainfall_curves_lock:
+            if rainfall_curves is None:
+                rainfall_curves = loadRainfallCurves()
+    offsets, values = rainfall_curves
+    start, stop = offsets[curve][str(D)]
+    view = values[start:stop]
+    view.flags.writeable = False
+    return view
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the rainfall distribution curves array file from Rainfall_Data_Curves.py")
+    parser.add_argument("--output", default=RAINFALL_CURVES_PATH, help="output .npy file (default: %(default)s)")
+    args = parser.parse_args()
+    buildRainfallCurves(args.output)
@@ -2,6 +2,8 @@
 # This file contains constant values that comprise the rainfall data curve values for different rainfall duration curves
 # Rainfall Duration Curve types: Type II, Type III, NOAA A, NOAA, B, NOAA C, NOAA D
 # Numerical key values correspond to D-Hour Rainfall
+# These values are the source of assets/SC_rainfall_data_curves.npy, which is what the hydrograph computations read (see Rainfall_Curves.py);
+# rebuild it with "python Rainfall_Curves.py" after changing them
 
 rainfall_data_curves = {
     "II": {
@@ -0,0 +1,98 @@
+# Local index of the NOAA Atlas 14 rainfall distribution zones (NOAA A, NOAA B, NOAA C, NOAA D) for South Carolina
+# The zone polygons are loaded once at startup into a Shapely STRtree, so rainfallDistributionCurve can find the zone of a point
+# without querying the SC_rainfallcurve map service
+#
+# To refresh the zone polygons from the map service, run:
+#   python Rainfall_Distribution_Zones.py
+# Or, to use a local GeoJSON file with an "Rf_Dist" property:
+#   python Rainfall_Distribution_Zones.py --geojson <file>
+
+import argparse
+import json
+import os
+import shapely
+from shapely.geometry import shape
+from Upstream_Client import upstreamGet
+
+# Location of the zone polygons (GeoJSON, WGS84); can be set with an environment variable
+RAINFALL_DISTRIBUTION_ZONES_PATH = os.environ.get("RAINFALL_DISTRIBUTION_ZONES_PATH", "assets/SC_rainfallcurve.geojson")
+
+map_service_query_URL = "https://gis.streamstats.usgs.gov/arcgis/rest/services/runoffmodeling/SC_rainfallcurve/MapServer/0/query"
+
+# Download the zone polygons from the map service and save them as GeoJSON
+def ingestRainfallDistributionZones(output_path=RAINFALL_DISTRIBUTION_ZONES_PATH, geojson_path=None):
+
+    if geojson_path is not None:
+        with open(geojson_path) as geojson_file:
+            features = json.load(geojson_file)["features"]
+    else:
+        # Page through the map service results in case there are more features than the service returns at once
+        features = []
+        while True:
+            response = upstreamGet(map_service_query_URL, params={
+                "where": "1=1",
+                "outFields": "Rf_Dist",
+                "returnGeometry": "true",
+                "outSR": 4326,
+                "resultOffset": len(features),
+                "f": "geojson"
+            })
+            if response.status_code != 200:
+                raise Exception("Request to rainfall distribution curve map service failed")
+            response_content = response.json()
+            features += response_content["features"]
+            exceeded_transfer_limit = response_content.get("exceededTransferLimit") or response_content.get("properties", {}).get("exceededTransferLimit")
+            if not exceeded_transfer_limit or len(response_content["features"]) == 0:
+                break
+
+    # Keep only the geometry and rainfall distribution curve letter of each zone
+    zones = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": feature["geometry"],
+                "properties": {"Rf_Dist": feature["properties"]["Rf_Dist"]}
+            }
+            for feature in features
+        ]
+    }
+    if len(zones["features"]) == 0:
+        raise Exception("No rainfall distribution zones found")
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_path, "w") as output_file:
+        json.dump(zones, output_file)
+
+# Load the zone polygons into an STRtree; returns None if they have not been ingested
+def loadRainfallDistributionZones(path=RAINFALL_DISTRIBUTION_ZONES_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path) as zones_file:
+        features = json.load(zones_file)["features"]
+    geometries = [shape(feature["geometry"]) for feature in features]
+    letters = [feature["properties"]["Rf_Dist"] for feature in features]
+    return shapely.STRtree(geometries), letters
+
+rainfall_distribution_zones = loadRainfallDistributionZones()
+
+# Returns the NOAA rainfall distribution curve letter of the zone that contains the coordinate point
+# Returns None if the zones have not been ingested or the point is outside all zones
+def localRainfallDistributionCurveLetter(lat, lon):
+    if rainfall_distribution_zones is None:
+        return None
+    tree, letters = rainfall_distribution_zones
+    indices = tree.query(shapely.Point(lon, lat), predicate="intersects")
+    if len(indices) == 0:
+        return None
+    return letters[min(indices)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the local NOAA Atlas 14 rainfall distribution zones")
+    parser.add_argument("--geojson", default=None, help="local GeoJSON file to use instead of the map service")
+    parser.add_argument("--output", default=RAINFALL_DISTRIBUTION_ZONES_PATH, help="output GeoJSON file (default: %(default)s)")
+    args = parser.parse_args()
+    ingestRainfallDistributionZones(args.output, args.geojson)
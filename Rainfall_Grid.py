@@ -0,0 +1,196 @@
+# Offline NOAA Atlas 14 precipitation frequency grid for South Carolina
+# Stores the 1-hr to 24-hr, 1-yr to 1000-yr precipitation frequency estimates as a single NumPy array that is memory-mapped at startup,
+# so rainfallData and getRI2 can answer without the NOAA Precipitation Frequency Data Server
+#
+# The grid is built once from the NOAA Atlas 14 Volume 2 ("orb") ASCII grids: https://hdsc.nws.noaa.gov/pub/hdsc/data/orb/
+# Download and unzip the mean estimate grids (e.g. orb100yr60ma.zip, orb100yr24ha.zip) for the 1, 2, 3, 6, 12, and 24-hour durations into one directory, then run:
+#   python Rainfall_Grid.py <directory of .asc grids>
+# To check that the grids are read back correctly, ingest them into a temporary file and compare lookups with the .asc values, e.g. with the fixture grids:
+#   python Rainfall_Grid.py fixtures/atlas14_grids --check
+
+import argparse
+import json
+import math
+import numpy as np
+import os
+import tempfile
+
+# Location of the grid built by the ingest command; can be set with an environment variable
+RAINFALL_GRID_PATH = os.environ.get("RAINFALL_GRID_PATH", "assets/SC_Atlas14_quantiles.npy")
+
+# Storm durations (rows) and average recurrence intervals (columns) stored for each grid cell, with the codes used in NOAA grid file names
+storm_durations = ["60m", "02h", "03h", "06h", "12h", "24h"] # 1, 2, 3, 6, 12, 24 hours
+recurrence_intervals = [1, 2, 5, 10, 25, 50, 100, 200, 500, 1000] # years
+
+# Extent of South Carolina (decimal degrees), with a margin of a few grid cells
+sc_extent = {
+    "west": -83.40,
+    "east": -78.50,
+    "south": 32.00,
+    "north": 35.25
+}
+
+NODATA = -1
+
+# NOAA Atlas 14 grids have a 30 arc-second cell size, and cell centers are at whole multiples of 1/120 degree
+ATLAS14_CELLS_PER_DEGREE = 120
+
+# Read the header of an ESRI ASCII grid
+def readASCIIGridHeader(path):
+    header = {}
+    with open(path) as grid_file:
+        for line in range(6):
+            name, value = grid_file.readline().split()
+            header[name.lower()] = float(value)
+    return header
+
+# Build the South Carolina grid from a directory of NOAA Atlas 14 ASCII grids
+# Values are stored as integer thousandths of an inch, matching the precision of the NOAA grids and data server
+def ingestRainfallGrid(grid_directory, output_path=RAINFALL_GRID_PATH, region="orb"):
+
+    header = None
+    grid = None
+    first_grid_header = None
+    for duration_index, duration in enumerate(storm_durations):
+        for recurrence_index, recurrence_interval in enumerate(recurrence_intervals):
+            grid_path = os.path.join(grid_directory, "{}{}yr{}a.asc".format(region, recurrence_interval, duration))
+            if not os.path.exists(grid_path):
+                raise Exception("Missing NOAA Atlas 14 grid: {}".format(grid_path))
+
+            # Crop the regional grid to the extent of South Carolina
+            # All grids must have the same georeferencing, or their values would be stored in the wrong cells
+            grid_header = readASCIIGridHeader(grid_path)
+            if first_grid_header is None:
+                first_grid_header = grid_header
+            elif any(grid_header[name] != first_grid_header[name] for name in ["ncols", "nrows", "xllcorner", "yllcorner", "cellsize"]):
+                raise Exception("NOAA Atlas 14 grid {} does not have the same georeferencing as the other grids".format(grid_path))
+            cellsize = grid_header["cellsize"]
+            ymax = grid_header["yllcorner"] + grid_header["nrows"] * cellsize
+            first_row = max(math.floor((ymax - sc_extent["north"]) / cellsize), 0)
+            last_row = min(math.ceil((ymax - sc_extent["south"]) / cellsize), int(grid_header["nrows"]))
+            first_column = max(math.floor((sc_extent["west"] - grid_header["xllcorner"]) / cellsize), 0)
+            last_column = min(math.ceil((sc_extent["east"] - grid_header["xllcorner"]) / cellsize), int(grid_header["ncols"]))
+            values = np.loadtxt(grid_path, skiprows=6 + first_row, max_rows=last_row - first_row, dtype=np.int32, usecols=range(first_column, last_column))
+            values[values == grid_header["nodata_value"]] = NODATA
+
+            if grid is None:
+                header = {
+                    "west": grid_header["xllcorner"] + first_column * cellsize,
+                    "north": ymax - first_row * cellsize,
+                    "cellsize": cellsize,
+                    "nrows": last_row - first_row,
+                    "ncols": last_column - first_column,
+                    "storm_durations": storm_durations,
+                    "recurrence_intervals": recurrence_intervals
+                }
+                grid = np.full((header["nrows"], header["ncols"], len(storm_durations), len(recurrence_intervals)), NODATA, dtype=np.int32)
+            grid[:, :, duration_index, recurrence_index] = values
+
+    # Save the grid and its georeferencing next to it
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    np.save(output_path, grid)
+    with open(os.path.splitext(output_path)[0] + ".json", "w") as header_file:
+        json.dump(header, header_file)
+
+# Memory-map the grid built by ingestRainfallGrid; returns None if it has not been built
+def loadRainfallGrid(path=RAINFALL_GRID_PATH):
+    header_path = os.path.splitext(path)[0] + ".json"
+    if not (os.path.exists(path) and os.path.exists(header_path)):
+        return None
+    with open(header_path) as header_file:
+        header = json.load(header_file)
+    return header, np.load(path, mmap_mode="r")
+
+rainfall_grid = loadRainfallGrid()
+
+# Returns the (row, column) index of the grid cell that contains the coordinate point, using the georeferencing of the NOAA grids
+# The index can be outside the grid
+def gridCell(header, lat, lon):
+    return math.floor((header["north"] - lat) / header["cellsize"]), math.floor((lon - header["west"]) / header["cellsize"])
+
+# Returns a key identifying the NOAA Atlas 14 grid cell that contains the coordinate point: the cell center, in 1/120 degree units
+# The rainfall cache and rainfallDataBatch use it to share estimates between points in the same cell; it does not need the offline grid,
+# and checkRainfallGrid checks that it agrees with the georeferencing of the NOAA grids
+def atlas14CellKey(lat, lon):
+    return "atlas14_{}_{}".format(round(lat * ATLAS14_CELLS_PER_DEGREE), round(lon * ATLAS14_CELLS_PER_DEGREE))
+
+# Returns the precipitation frequency estimates (inches) of the grid cell that contains the coordinate point, as a float array
+# Rows correspond to storm durations 1, 2, 3, 6, 12, 24 hours; columns correspond to average recurrence intervals 1, 2, 5, 10, 25, 50, 100, 200, 500, 1000 years
+# Returns None if the grid has not been built or has no data at the coordinate point
+# grid (optional): a grid returned by loadRainfallGrid to use instead of the one built by the ingest command
+def offlineRainfallQuantiles(lat, lon, grid=None):
+    if grid is None:
+        grid = rainfall_grid
+    if grid is None:
+        return None
+    header, grid = grid
+    row, column = gridCell(header, lat, lon)
+    if row < 0 or row >= header["nrows"] or column < 0 or column >= header["ncols"]:
+        return None
+    values = grid[row, column]
+    if (values == NODATA).any():
+        return None
+    return values / 1000.0
+
+# Ingest the NOAA grids in grid_directory into a temporary file, then check that looking up the center and corners of every cell
+# returns the values of the .asc grids, that points outside the grids or in cells without data return None,
+# and that the cell centers of the .asc grids are on the 30 arc-second lattice, so atlas14CellKey gives every point in a cell the key of its center
+def checkRainfallGrid(grid_directory, region="orb"):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "grid.npy")
+        ingestRainfallGrid(grid_directory, path, region)
+        checked_grid = loadRainfallGrid(path)
+        header = checked_grid[0]
+
+        lookups = 0
+        for duration_index, duration in enumerate(storm_durations):
+            for recurrence_index, recurrence_interval in enumerate(recurrence_intervals):
+                grid_path = os.path.join(grid_directory, "{}{}yr{}a.asc".format(region, recurrence_interval, duration))
+                grid_header = readASCIIGridHeader(grid_path)
+                values = np.loadtxt(grid_path, skiprows=6, dtype=np.int32, ndmin=2)
+                cellsize = grid_header["cellsize"]
+                ymax = grid_header["yllcorner"] + grid_header["nrows"] * cellsize
+                for row in range(int(grid_header["nrows"])):
+                    for column in range(int(grid_header["ncols"])):
+                        lat = ymax - (row + 0.5) * cellsize
+                        lon = grid_header["xllcorner"] + (column + 0.5) * cellsize
+                        if not (sc_extent["south"] <= lat <= sc_extent["north"] and sc_extent["west"] <= lon <= sc_extent["east"]):
+                            continue
+                        if max(abs(lat * ATLAS14_CELLS_PER_DEGREE - round(lat * ATLAS14_CELLS_PER_DEGREE)), abs(lon * ATLAS14_CELLS_PER_DEGREE - round(lon * ATLAS14_CELLS_PER_DEGREE))) > 1e-6:
+                            raise Exception("Cell center {}, {} of {} is not on the 30 arc-second lattice used by atlas14CellKey".format(lat, lon, grid_path))
+                        # Cell center and points just inside each corner of the cell
+                        cell_key = atlas14CellKey(lat, lon)
+                        for lat_offset, lon_offset in [(0, 0), (0.49, -0.49), (0.49, 0.49), (-0.49, -0.49), (-0.49, 0.49)]:
+                            if atlas14CellKey(lat + lat_offset * cellsize, lon + lon_offset * cellsize) != cell_key:
+                                raise Exception("Cell key at {}, {} does not match the cell of {}".format(lat + lat_offset * cellsize, lon + lon_offset * cellsize, grid_path))
+                            quantiles = offlineRainfallQuantiles(lat + lat_offset * cellsize, lon + lon_offset * cellsize, checked_grid)
+                            expected = None if values[row, column] == grid_header["nodata_value"] else values[row, column] / 1000.0
+                            found = None if quantiles is None else quantiles[duration_index, recurrence_index]
+                            if found != expected:
+                                raise Exception("Lookup at {}, {} returned {} instead of {} from {}".format(lat, lon, found, expected, grid_path))
+                            lookups += 1
+
+        # Points just outside the grid
+        for lat, lon in [(header["north"] + header["cellsize"] / 2, header["west"] + header["cellsize"] / 2),
+                         (header["north"] - header["nrows"] * header["cellsize"] - header["cellsize"] / 2, header["west"] + header["cellsize"] / 2),
+                         (header["north"] - header["cellsize"] / 2, header["west"] - header["cellsize"] / 2),
+                         (header["north"] - header["cellsize"] / 2, header["west"] + header["ncols"] * header["cellsize"] + header["cellsize"] / 2)]:
+            if offlineRainfallQuantiles(lat, lon, checked_grid) is not None:
+                raise Exception("Lookup at {}, {} outside the grid returned data".format(lat, lon))
+
+    print("{} x {} cells, {} lookups match the NOAA grids".format(header["nrows"], header["ncols"], lookups))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the offline South Carolina NOAA Atlas 14 precipitation frequency grid")
+    parser.add_argument("grid_directory", help="directory containing the unzipped NOAA Atlas 14 ASCII grids")
+    parser.add_argument("--output", default=RAINFALL_GRID_PATH, help="output .npy file (default: %(default)s)")
+    parser.add_argument("--region", default="orb", help="NOAA Atlas 14 region prefix of the grid file names (default: %(default)s)")
+    parser.add_argument("--check", action="store_true", help="check lookups against the grids instead of building the offline grid")
+    args = parser.parse_args()
+    if args.check:
+        checkRainfallGrid(args.grid_directory, args.region)
+    else:
+        ingestRainfallGrid(args.grid_directory, args.output, args.region)
@@ -0,0 +1,163 @@
+# Single-band raster reader that keeps the dataset open and caches decoded blocks in memory
+# Blocks are evicted in least-recently-used order once they take more than max_bytes
+# GDAL dataset handles must not be shared between threads, so each thread opens the dataset once and keeps it open;
+# the block cache is shared by all threads
+
+import collections
+import math
+import numpy as np
+import rasterio
+import threading
+from rasterio.windows import Window
+
+
+class RasterBlockCache:
+    # path: location of the raster file
+    # max_bytes: maximum size of the decoded blocks kept in memory (int)
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._blocks = collections.OrderedDict() # (block row, block column): block array
+        self._size = 0 # bytes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profile = None
+
+    def _dataset(self):
+        # Open the dataset the first time each thread uses it so importing this module never touches the filesystem
+        dataset = getattr(self._local, "dataset", None)
+        if dataset is None:
+            dataset = rasterio.open(self.path)
+            self._local.dataset = dataset
+            if self._profile is None:
+                self._profile = {
+                    "transform": dataset.transform,
+                    "nodata": dataset.nodata,
+                    "dtype": dataset.dtypes[0],
+                    "height": dataset.height,
+                    "width": dataset.width,
+                    "block_shape": dataset.block_shapes[0]
+                }
+        return dataset
+
+    @property
+    def transform(self):
+        self._dataset()
+        return self._profile["transform"]
+
+    # (height, width) in cells
+    @property
+    def shape(self):
+        self._dataset()
+        return self._profile["height"], self._profile["width"]
+
+    @property
+    def nodata(self):
+        self._dataset()
+        return self._profile["nodata"]
+
+    @property
+    def dtype(self):
+        self._dataset()
+        return self._profile["dtype"]
+
+    # Returns the raster values that cover bounds (west, south, east, north, in the coordinate system of the raster) and their affine transform
+    # The values include a margin of one cell around bounds; parts of bounds outside the raster are left out
+    def read(self, bounds):
+        self._dataset()
+        profile = self._profile
+
+        # Window of raster cells that covers bounds, with a margin of one cell and clipped to the raster
+        west, south, east, north = bounds
+        inverse_transform = ~profile["transform"]
+        column_start, row_start = inverse_transform * (west, north)
+        column_stop, row_stop = inverse_transform * (east, south)
+        row_start = min(max(math.floor(row_start) - 1, 0), profile["height"])
+        row_stop = min(max(math.ceil(row_stop) + 1, row_start), profile["height"])
+        column_start = min(max(math.floor(column_start) - 1, 0), profile["width"])
+        column_stop = min(max(math.ceil(column_stop) + 1, column_start), profile["width"])
+
+        values = self.readWindow(row_start, row_stop, column_start, column_stop)
+        transform = profile["transform"] * profile["transform"].translation(column_start, row_start)
+        return values, transform
+
+    # Returns the raster values in rows row_start to row_stop - 1 and columns column_start to column_stop - 1, which must be inside the raster
+    def readWindow(self, row_start, row_stop, column_start, column_stop):
+        dataset = self._dataset()
+        profile = self._profile
+        block_height, block_width = profile["block_shape"]
+
+        # Copy the part of each block that overlaps the window
+        block_rows = range(row_start // block_height, -(-row_stop // block_height))
+        block_columns = range(column_start // block_width, -(-column_stop // block_width))
+        blocks = self._readBlocks(dataset, block_rows, block_columns)
+        values = np.empty((row_stop - row_start, column_stop - column_start), dtype=profile["dtype"])
+        for (block_row, block_column), block in blocks.items():
+            block_row_start = block_row * block_height
+            block_column_start = block_column * block_width
+            first_row = max(row_start, block_row_start)
+            last_row = min(row_stop, block_row_start + block_height)
+            first_column = max(column_start, block_column_start)
+            last_column = min(column_stop, block_column_start + block_width)
+            values[first_row - row_start:last_row - row_start, first_column - column_start:last_column - column_start] = \
+                block[first_row - block_row_start:last_row - block_row_start, first_column - block_column_start:last_column - block_column_start]
+
+        return values
+
+    def _readBlocks(self, dataset, block_rows, block_columns):
+        blocks = {}
+        missing = []
+        with self._lock:
+            for block_row in block_rows:
+                for block_column in block_columns:
+                    block = self._blocks.get((block_row, block_column))
+                    if block is None:
+                        missing.append((block_row, block_column))
+                    else:
+                        self._blocks.move_to_end((block_row, block_column))
+                        blocks[block_row, block_column] = block
+            self.hits += len(blocks)
+            self.misses += len(missing)
+
+        if len(missing) > 0:
+            # Read all missing blocks with a single read of the window that contains them
+            block_height, block_width = self._profile["block_shape"]
+            first_block_row = min(block_row for block_row, block_column in missing)
+            last_block_row = max(block_row for block_row, block_column in missing)
+            first_block_column = min(block_column for block_row, block_column in missing)
+            last_block_column = max(block_column for block_row, block_column in missing)
+            row_offset = first_block_row * block_height
+            column_offset = first_block_column * block_width
+            window = Window(column_offset, row_offset,
+                            min((last_block_column + 1) * block_width, self._profile["width"]) - column_offset,
+                            min((last_block_row + 1) * block_height, self._profile["height"]) - row_offset)
+            values = dataset.read(1, window=window)
+
+            with self._lock:
+                for block_row, block_column in missing:
+                    row = block_row * block_height - row_offset
+                    column = block_column * block_width - column_offset
+                    block = values[row:row + block_height, column:column + block_width].copy()
+                    blocks[block_row, block_column] = block
+                    if (block_row, block_column) not in self._blocks:
+                        self._blocks[block_row, block_column] = block
+                        self._size += block.nbytes
+                # Evict the least recently used blocks beyond max_bytes
+                while self._size > self.max_bytes and len(self._blocks) > 0:
+                    evicted_key, evicted_block = self._blocks.popitem(last=False)
+                    self._size -= evicted_block.nbytes
+
+        return blocks
+
+    # Returns block hit and miss counts since the process started, and the size of the cached blocks
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+            "cached_bytes": self._size
+        }
@@ -6,7 +6,7 @@ from SC_Synthetic_UH_Method import computeSCSyntheticUnitHydrograph
 def calcStormPonds(lat, lon, AEP, CNModificationMethod, Area, Tc, RainfallDistributionCurve, PRF, CN, S, Ia,
               pondOption, pond_bottom_elev, Orif1_Coeff, Orif1_Dia, Orif1_CtrEL, Orif1_NumOpenings, Orif2_Coeff, Orif2_Dia, Orif2_CtrEL, Orif2_NumOpenings, Rec_Weir_Coeff, Rec_Weir_Ex, Rec_Weir_Length, Rec_WeirCrest_EL, Rec_Num_Weirs, OS_BCWeir_Coeff, OS_Weir_Ex, OS_Length , OS_Crest_EL , Seepage_Bottom, Seepage_Side,
               length = None, w1 = None, w2 = None, side_slope_z = None, bottom_slope = None,
-              Elev_Area = None):
+              Elev_Area = None, rainfall_depths = None):
 
     # lat, lon, AEP, CNModificationMethod, Area, Tc, RainfallDistributionCurve, PRF, CN, S, Ia: see computeSCSyntheticUnitHydrograph
     # pondOption: 1 or 2 
@@ -32,10 +32,11 @@ def calcStormPonds(lat, lon, AEP, CNModificationMethod, Area, Tc, RainfallDistri
     # side_slope_z: side slope z of inverted quadrilateral frustum in feet, for pond option 1
     # bottom_slope: bottom slope of inverted quadrilateral frustum in feet, for pond option 1
     # Elev_Area: list of values elevation (ft-MSL) vs surface area (sq ft), for pond option 2
+    # rainfall_depths (optional): see computeSCSyntheticUnitHydrograph
 
 
     # Calculate Unit Hydrograph
-    unitHydrograph = computeSCSyntheticUnitHydrograph(lat, lon, AEP, CNModificationMethod, Area, Tc, RainfallDistributionCurve, PRF, CN, S, Ia)
+    unitHydrograph = computeSCSyntheticUnitHydrograph(lat, lon, AEP, CNModificationMethod, Area, Tc, RainfallDistributionCurve, PRF, CN, S, Ia, rainfall_depths)
 
     # Fixed Variables
     storm_duration = unitHydrograph[2]['storm_duration']
@@ -0,0 +1,182 @@
+# Shared HTTP client for upstream services (NOAA Precipitation Frequency Data Server, StreamStats map services)
+# A single pooled session keeps connections alive between requests, so each request does not pay for DNS and a new TLS handshake,
+# and every request has explicit timeouts and retries 5xx responses and failed connections with jittered exponential backoff
+# Read timeouts are not retried, and all attempts of a request share one deadline, so a slow upstream service cannot hold a worker for long
+# upstreamGetAsync provides the same behavior for async endpoints, so independent upstream requests can run concurrently
+# singleFlight and singleFlightAsync coalesce concurrent lookups of the same key into one upstream request
+
+import asyncio
+import concurrent.futures
+import httpx
+import os
+import random
+import requests
+import threading
+import time
+import weakref
+from requests.adapters import HTTPAdapter
+
+# Settings can be changed with environment variables
+CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "3.05")) # seconds
+READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", "30")) # seconds
+MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", "3"))
+BACKOFF_FACTOR = float(os.environ.get("UPSTREAM_BACKOFF_FACTOR", "0.5")) # seconds; retry n waits a random time up to BACKOFF_FACTOR * 2**n
+POOL_MAXSIZE = int(os.environ.get("UPSTREAM_POOL_MAXSIZE", "10")) # connections kept alive per host
+TOTAL_TIMEOUT = float(os.environ.get("UPSTREAM_TOTAL_TIMEOUT", "45")) # seconds; no attempt starts or keeps reading after this time since the first attempt
+
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+
+# httpx connections belong to the event loop that opened them, so each event loop gets its own async client
+async_sessions = weakref.WeakKeyDictionary()
+
+def asyncSession():
+    loop = asyncio.get_running_loop()
+    async_session = async_sessions.get(loop)
+    if async_session is None:
+        async_session = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=2 * POOL_MAXSIZE, max_keepalive_connections=2 * POOL_MAXSIZE) # two upstream hosts
+        )
+        async_sessions[loop] = async_session
+    return async_session
+
+metrics = {
+    "requests": 0,
+    "retries": 0,
+    "failures": 0,
+    "coalesced": 0
+}
+metrics_lock = threading.Lock()
+
+def countMetric(name):
+    with metrics_lock:
+        metrics[name] += 1
+
+# Returns the time (seconds) to wait before retry number attempt, or None if the retry could not start before deadline (time.monotonic())
+def retryDelay(attempt, deadline):
+    if attempt > MAX_RETRIES:
+        return None
+    delay = random.uniform(0, BACKOFF_FACTOR * 2 ** attempt)
+    if time.monotonic() + delay + CONNECT_TIMEOUT >= deadline:
+        return None
+    return delay
+
+# Send a GET request to an upstream service
+# Returns the response; 5xx responses and connection errors (including connect timeouts) are retried up to MAX_RETRIES times
+# as long as the retry can start before TOTAL_TIMEOUT; read timeouts are raised without retrying
+# If all retries fail, the last 5xx response is returned or the last connection error is raised
+def upstreamGet(url, **kwargs):
+    deadline = time.monotonic() + TOTAL_TIMEOUT
+    countMetric("requests")
+    attempt = 0
+    while True:
+        kwargs["timeout"] = (CONNECT_TIMEOUT, min(READ_TIMEOUT, deadline - time.monotonic()))
+        try:
+            response = session.get(url, **kwargs)
+        except requests.ConnectionError:
+            delay = retryDelay(attempt + 1, deadline)
+            if delay is None:
+                countMetric("failures")
+                raise
+        except requests.Timeout:
+            countMetric("failures")
+            raise
+        else:
+            if response.status_code < 500:
+                return response
+            delay = retryDelay(attempt + 1, deadline)
+            if delay is None:
+                countMetric("failures")
+                return response
+        attempt += 1
+        countMetric("retries")
+        time.sleep(delay)
+
+# Async version of upstreamGet, for use in async endpoints
+async def upstreamGetAsync(url, **kwargs):
+    deadline = time.monotonic() + TOTAL_TIMEOUT
+    countMetric("requests")
+    attempt = 0
+    while True:
+        kwargs["timeout"] = httpx.Timeout(min(READ_TIMEOUT, deadline - time.monotonic()), connect=CONNECT_TIMEOUT)
+        try:
+            response = await asyncSession().get(url, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            delay = retryDelay(attempt + 1, deadline)
+            if delay is None:
+                countMetric("failures")
+                raise
+        except httpx.TransportError:
+            countMetric("failures")
+            raise
+        else:
+            if response.status_code < 500:
+                return response
+            delay = retryDelay(attempt + 1, deadline)
+            if delay is None:
+                countMetric("failures")
+                return response
+        attempt += 1
+        countMetric("retries")
+        await asyncio.sleep(delay)
+
+# Lookups in progress, by key
+in_flight = {}
+in_flight_lock = threading.Lock()
+async_in_flight = weakref.WeakKeyDictionary() # by event loop, then by key
+
+# Returns function(*args), sharing the result with any other thread that calls singleFlight with the same key while it runs
+def singleFlight(key, function, *args):
+    with in_flight_lock:
+        call = in_flight.get(key)
+        leader = call is None
+        if leader:
+            call = concurrent.futures.Future()
+            in_flight[key] = call
+    if not leader:
+        countMetric("coalesced")
+        return call.result()
+
+    try:
+        result = function(*args)
+        call.set_result(result)
+        return result
+    except BaseException as exception:
+        call.set_exception(exception)
+        raise
+    finally:
+        with in_flight_lock:
+            del in_flight[key]
+
+# Async version of singleFlight: returns await function(*args), sharing the result with any other task that calls singleFlightAsync with the same key while it runs
+async def singleFlightAsync(key, function, *args):
+    loop = asyncio.get_running_loop()
+    loop_in_flight = async_in_flight.setdefault(loop, {})
+    task = loop_in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(function(*args))
+        loop_in_flight[key] = task
+        task.add_done_callback(lambda done_task: loop_in_flight.pop(key, None))
+    else:
+        countMetric("coalesced")
+    # Shield the shared task so one cancelled caller does not cancel it for the others
+    return await asyncio.shield(task)
+
+# Returns request, retry, coalesced lookup, and connection pool metrics since the process started
+# Pool hits are requests that reused a kept-alive connection; pool misses are requests that opened a new connection (requests session only)
+def upstreamMetrics():
+    pool_requests = 0
+    pool_connections = 0
+    for key in adapter.poolmanager.pools.keys():
+        pool = adapter.poolmanager.pools.get(key)
+        if pool is not None:
+            pool_requests += pool.num_requests
+            pool_connections += pool.num_connections
+    with metrics_lock:
+        upstream_metrics = dict(metrics)
+    upstream_metrics["pool_hits"] = pool_requests - pool_connections
+    upstream_metrics["pool_misses"] = pool_connections
+    return upstream_metrics
@@ -1,12 +1,21 @@
+import asyncio
+import json
+import numpy as np
 from fastapi import FastAPI, HTTPException, Response, Body
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
+from typing import List, Union
 
-from SC_Synthetic_UH_Method import weightedCurveNumber, PRFData, rainfallData, rainfallDistributionCurve, computeSCSyntheticUnitHydrograph, calculateMissingParametersSCSUH
+from SC_Synthetic_UH_Method import weightedCurveNumber, weightedCurveNumberAllAEPs, PRFData, rainfallDataAsync, rainfallDataBatch, rainfallDataDict, rainfallDistributionCurveAsync, rainfallDepthMatrix, unitHydrographKernel, computeSCSyntheticUnitHydrograph, computeSCSyntheticUnitHydrographAllAEPs, calculateMissingParametersSCSUH
 from Bohman_Method_1989 import computeRuralFloodHydrographBohman1989
-from Bohman_Method_1992 import getRI2, computeUrbanFloodHydrographBohman1992
+from Bohman_Method_1992 import getRI2Async, computeUrbanFloodHydrographBohman1992
 from Tc_Calculator import lagTimeMethodTimeOfConcentration, travelTimeMethodTimeOfConcentration
 from Storm_Ponds import calcStormPonds
+from Precipitation_Frequency import rainfall_quantile_cache
+from Curve_Number_Raster import curve_number_histogram_cache, curve_number_raster
+from Upstream_Client import upstreamMetrics
 
 app = FastAPI(
     title='SC Runoff Modeling Services',
@@ -38,7 +47,7 @@ app.add_middleware(
 class CurveNumber(BaseModel):
     # all fields are required
     watershedFeatures: list = Field(..., title="watershed features", description="list of features of delineated watershed returned by StreamStatsServices")
-    P24hr: float = Field(..., title="24-hour rainfall depth", description="24-hour rainfall depth for the associated Annual Exceedance Probability (AEP), inches (float)", example="5.74")
+    P24hr: Union[float, List[float]] = Field(..., title="24-hour rainfall depth", description="24-hour rainfall depth for the associated Annual Exceedance Probability (AEP), inches (float); or a list of depths for several AEPs, to extract the Curve Number data once and return lists of CN, S, and Ia (list)", example="5.74")
     weightingMethod: str = Field(..., title="weighting method", description="weighting method for Standard CN ('runoff' or 'area')", example="runoff")
 
     class Config:
@@ -50,6 +59,23 @@ class CurveNumber(BaseModel):
             }
         }
 
+class CurveNumberAllAEPs(BaseModel):
+    # all fields are required
+    lat: float = Field(..., title="latitude", description="latitude coordinate of the drainage point (float)", example="33.3946")
+    lon: float = Field(..., title="longitude", description="longitude coordinate of the drainage point (float)", example="-80.3474")
+    watershedFeatures: list = Field(..., title="watershed features", description="list of features of delineated watershed returned by StreamStatsServices")
+    weightingMethod: str = Field(..., title="weighting method", description="weighting method for Standard CN ('runoff' or 'area')", example="runoff")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "lat": 33.3946,
+                "lon": -80.3474,
+                "watershedFeatures": CurveNumber.Config.schema_extra["example"]["watershedFeatures"],
+                "weightingMethod": "runoff"
+            }
+        }
+
 class PRF(BaseModel):
     # all fields are required
     prfData: list = Field(..., title="PRF Data", description="data corresponding to PRF values (list)")
@@ -83,6 +109,26 @@ class RainfallData(BaseModel):
             }
         }
 
+class RainfallDataBatch(BaseModel):
+    # all fields are required
+    points: List[RainfallData] = Field(..., title="points", description="list of drainage points, each with lat and lon (list)")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "points": [
+                    {
+                        "lat": 33.3946,
+                        "lon": -80.3474
+                    },
+                    {
+                        "lat": 34.0007,
+                        "lon": -81.0348
+                    }
+                ]
+            }
+        }
+
 class RainfallDistributionCurve(BaseModel):
     # all fields are required
     lat: float = Field(..., title="latitude", description="latitude coordinate of the drainage point (float)", example="33.3946")
@@ -297,6 +343,8 @@ class SCSyntheticUnitHydrograph(BaseModel):
     CN: float = Field(..., title="Curve Number", description="weighted Curve Number (float)", example="67.3")
     S: float = Field(..., title="Watershed Retention", description="watershed Retention, S (float)", example="4.86")
     Ia: float = Field(..., title="Initial Abstraction", description="Initial Abstraction, Ia (float)", example="0.97")
+    rainfallDepths: List[float] = Field(default=None, title="Rainfall Depths", description="1, 2, 3, 6, 12, and 24-hour rainfall depths (inches) for the AEP, as returned by the calculatemissingparametersSCSUH endpoint; requested from NOAA if not provided (list)", example="[2.74, 3.41, 3.73, 4.45, 5.24, 6.15]")
+    returnCumulativeRunoff: bool = Field(default=False, title="Return Cumulative Runoff", description="if true, the response also includes the cumulative rainfall P(t) and cumulative runoff QCN(t) of each D-hour storm, for quality assurance (bool)", example="false")
 
     class Config:
         schema_extra = {
@@ -315,6 +363,35 @@ class SCSyntheticUnitHydrograph(BaseModel):
             }
         }
 
+class SCSyntheticUnitHydrographAllAEPs(BaseModel):
+    lat: float = Field(..., title="latitude", description="latitude coordinate of the drainage point (float)", example="33.3946")
+    lon: float = Field(..., title="longitude", description="longitude coordinate of the drainage point (float)", example="-80.3474")
+    CNModificationMethod: str = Field(..., title="Curve Number Modification Method", description="method used to modify the Curve Number; options are 'McCuen' or 'Merkel' (string)", example="Merkel")
+    Area: float = Field(..., title="Area", description="drainage area of delineated basin (float)", example="100.0")
+    Tc: float = Field(..., title="Time of Concentration", description="Time of Concentration as computed by Travel Time Method or Lag Time Equation (float)", example="64.5")
+    RainfallDistributionCurve: str = Field(..., title="Rainfall Distribution Curve", description="rainfall distribution curve letter; options are 'II', 'III', 'A', 'B', 'C', 'D' (string)", example="II")
+    PRF: float = Field(..., title="Peak Rate Factor (float)", description="", example="240")
+    CN: Union[float, List[float]] = Field(..., title="Curve Number", description="weighted Curve Number (float); or a list of the weighted Curve Numbers for AEPs 100, 50, 20, 10, 4, 2, and 1, as returned by the weightedcurvenumberallaeps endpoint (list)", example="67.3")
+    S: Union[float, List[float]] = Field(..., title="Watershed Retention", description="watershed Retention, S (float); or a list with one value for each AEP (list)", example="4.86")
+    Ia: Union[float, List[float]] = Field(..., title="Initial Abstraction", description="Initial Abstraction, Ia (float); or a list with one value for each AEP (list)", example="0.97")
+    rainfallDepths: List[List[float]] = Field(default=None, title="Rainfall Depths", description="1, 2, 3, 6, 12, and 24-hour rainfall depths (inches) for AEPs 100, 50, 20, 10, 4, 2, and 1, one list for each AEP; requested from NOAA if not provided (list)", example="[[1.4, 1.7, 1.85, 2.2, 2.6, 3.0], ...]")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "lat": 33.3946,
+                "lon": -80.3474,
+                "CNModificationMethod": "Merkel",
+                "Area": 100.0,
+                "Tc": 64.5,
+                "RainfallDistributionCurve": "II",
+                "PRF": 240,
+                "CN": 67.3,
+                "S": 4.86,
+                "Ia": 0.97
+            }
+        }
+
 class CalculateMissingParametersSCSUH(BaseModel):
     lat: float = Field(..., title="latitude", description="latitude coordinate of the drainage point (float)", example="33.3946")
     lon: float = Field(..., title="longitude", description="longitude coordinate of the drainage point (float)", example="-80.3474")
@@ -503,6 +580,7 @@ class calculateStormPonds(BaseModel):
     side_slope_z: float = Field(default=None, title="Side Slope of Inverted Quadrilateral Frustum", description="Side slope z of inverted quadrilateral frustum, for pond option 1, (float)", example="3.0")
     bottom_slope: float = Field(default=None, title="Bottom Slope of Inverted Quadrilateral Frustum", description="Bottom slope of inverted quadrilateral frustum in %, for pond option 1, (float)", example=".5")
     Elev_Area: list = Field(default=None, title="Elevation vs Surface Area", description="Elevation in ft-MSL vs Surface Area in sq ft, for pond option 2, (float)", example="[[100, 2000], [101,2100],[102,2200],[103,2400],[104, 2900],[105,3300],[106,3700],[107,4000],[108,4400],[109,4800]]")
+    rainfallDepths: List[float] = Field(default=None, title="Rainfall Depths", description="1, 2, 3, 6, 12, and 24-hour rainfall depths (inches) for the AEP, as returned by the calculatemissingparametersSCSUH endpoint; requested from NOAA if not provided (list)", example="[2.74, 3.41, 3.73, 4.45, 5.24, 6.15]")
     
     class Config:
         schema_extra = {
@@ -605,6 +683,17 @@ class calculateStormPonds(BaseModel):
 async def root():
     return {"message": "Hello World"}
 
+# Upstream request and cache metrics for monitoring
+@app.get("/metrics/", include_in_schema=False)
+def metrics():
+    return {
+        "upstream": upstreamMetrics(),
+        "rainfall_cache": rainfall_quantile_cache.stats(),
+        "curve_number_block_cache": curve_number_raster.stats(),
+        "curve_number_cache": curve_number_histogram_cache.stats(),
+        "unit_hydrograph_kernel_cache": unitHydrographKernel.cache_info()._asdict()
+    }
+
 @app.post("/weightedcurvenumber/")
 def weighted(request_body: CurveNumber, response: Response):
 
@@ -614,6 +703,8 @@ def weighted(request_body: CurveNumber, response: Response):
             request_body.P24hr,
             request_body.weightingMethod
         )
+        if isinstance(request_body.P24hr, list):
+            runoff_weighted_CN, WS_retention_S, initial_abstraction_Ia = runoff_weighted_CN.tolist(), WS_retention_S.tolist(), initial_abstraction_Ia.tolist()
         return {
             "CN": runoff_weighted_CN,
             "S": WS_retention_S,
@@ -623,6 +714,22 @@ def weighted(request_body: CurveNumber, response: Response):
     except Exception as e:
         raise HTTPException(status_code = 500, detail =  str(e))
 
+# Returns the weighted CN, S, and Ia for every AEP, extracting the Curve Number data once
+@app.post("/weightedcurvenumberallaeps/")
+async def weightedallaeps(request_body: CurveNumberAllAEPs, response: Response):
+
+    try: 
+        rainfall_data = await rainfallDataAsync(request_body.lat, request_body.lon)
+        return await run_in_threadpool(
+            weightedCurveNumberAllAEPs,
+            request_body.watershedFeatures,
+            rainfall_data,
+            request_body.weightingMethod
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code = 500, detail =  str(e))
+
 @app.post("/prf/")
 def prfdata(request_body: PRF, response: Response):
 
@@ -639,74 +746,39 @@ def prfdata(request_body: PRF, response: Response):
 
 
 @app.post("/rainfall/")
-def rainfalldata(request_body: RainfallData, response: Response):
+async def rainfalldata(request_body: RainfallData, response: Response):
 
     try: 
-        P1_1,P1_2,P1_3,P1_6,P1_12,P1_24,P2_1,P2_2,P2_3,P2_6,P2_12,P2_24,P5_1,P5_2,P5_3,P5_6,P5_12,P5_24,P10_1,P10_2,P10_3,P10_6,P10_12,P10_24,P25_1,P25_2,P25_3,P25_6,P25_12,P25_24,P50_1,P50_2,P50_3,P50_6,P50_12,P50_24,P100_1,P100_2,P100_3,P100_6,P100_12,P100_24,P2_24_1,P2_24_2,P2_24_5,P2_24_10,P2_24_25,P2_24_50,P2_24_100 = rainfallData(
+        rainfall_data = await rainfallDataAsync(
             request_body.lat,
             request_body.lon
         )
 
-        return {
-            "P1_1": P1_1, 
-            "P1_2": P1_2,
-            "P1_3": P1_3,
-            "P1_6": P1_6,
-            "P1_12": P1_12,
-            "P1_24": P1_24,
-            "P2_1": P2_1, 
-            "P2_2": P2_2,
-            "P2_3": P2_3,
-            "P2_6": P2_6,
-            "P2_12": P2_12,
-            "P2_24": P2_24,
-            "P5_1": P5_1, 
-            "P5_2": P5_2,
-            "P5_3": P5_3,
-            "P5_6": P5_6,
-            "P5_12": P5_12,
-            "P5_24": P5_24,
-            "P10_1": P10_1, 
-            "P10_2": P10_2,
-            "P10_3": P10_3,
-            "P10_6": P10_6,
-            "P10_12": P10_12,
-            "P10_24": P10_24,
-            "P25_1": P25_1,
-            "P25_2": P25_2,
-            "P25_3": P25_3,
-            "P25_6": P25_6,
-            "P25_12": P25_12,
-            "P25_24": P25_24,
-            "P50_1": P50_1,
-            "P50_2": P50_2,
-            "P50_3": P50_3,
-            "P50_6": P50_6,
-            "P50_12": P50_12,
-            "P50_24" : P50_24,
-            "P100_1": P100_1,
-            "P100_2": P100_2,
-            "P100_3": P100_3,
-            "P100_6": P100_6,
-            "P100_12": P100_12,
-            "P100_24": P100_24,
-            "P2_24_1": P2_24_1,
-            "P2_24_2": P2_24_2,
-            "P2_24_5": P2_24_5,
-            "P2_24_10": P2_24_10,
-            "P2_24_25": P2_24_25,
-            "P2_24_50": P2_24_50,
-            "P2_24_100": P2_24_100
-        }
+        return rainfallDataDict(rainfall_data)
 
     except Exception as e:
         raise HTTPException(status_code = 500, detail =  str(e))
 
+# Returns the rainfall endpoint results for each point as newline-delimited JSON, streamed in the order of the points
+# Points whose rainfall data could not be retrieved have an "error" value instead
+@app.post("/rainfall/batch/")
+async def rainfalldatabatch(request_body: RainfallDataBatch):
+
+    async def rainfallDataLines():
+        async for lat, lon, rainfall_data in rainfallDataBatch([(point.lat, point.lon) for point in request_body.points]):
+            if isinstance(rainfall_data, Exception):
+                line = {"lat": lat, "lon": lon, "error": str(rainfall_data)}
+            else:
+                line = {"lat": lat, "lon": lon, **rainfallDataDict(rainfall_data)}
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(rainfallDataLines(), media_type="application/x-ndjson")
+
 @app.post("/rainfalldistributioncurve/")
-def rainfalldistributioncurve(request_body: RainfallDistributionCurve, response: Response):
+async def rainfalldistributioncurve(request_body: RainfallDistributionCurve, response: Response):
 
     try: 
-        rainfall_distribution_curve_letter, rainfall_distribution_curve_number = rainfallDistributionCurve(
+        rainfall_distribution_curve_letter, rainfall_distribution_curve_number = await rainfallDistributionCurveAsync(
             request_body.lat,
             request_body.lon
         )
@@ -719,10 +791,10 @@ def rainfalldistributioncurve(request_body: RainfallDistributionCurve, response:
         raise HTTPException(status_code = 500, detail =  str(e))
 
 @app.post("/RI2/")
-def ri2(request_body: RainfallData, response: Response):
+async def ri2(request_body: RainfallData, response: Response):
 
     try: 
-        ri2 = getRI2(
+        ri2 = await getRI2Async(
             request_body.lat,
             request_body.lon
         )
@@ -826,7 +898,7 @@ def traveltimetc(request_body: TravelTimeMethodTimeOfConcentration, response: Re
 def scsyntheticunithydrograph(request_body: SCSyntheticUnitHydrograph, response: Response):
 
     try: 
-        watershed_data, unit_hydrograph_data, runoff_results_table, hydrograph_ordinates_table = computeSCSyntheticUnitHydrograph(
+        tables = computeSCSyntheticUnitHydrograph(
             request_body.lat,
             request_body.lon,
             request_body.AEP,
@@ -837,8 +909,51 @@ def scsyntheticunithydrograph(request_body: SCSyntheticUnitHydrograph, response:
             request_body.PRF,
             request_body.CN,
             request_body.S,
-            request_body.Ia
+            request_body.Ia,
+            request_body.rainfallDepths,
+            request_body.returnCumulativeRunoff
         )
+        response_content = {
+            "watershed_data": tables[0],
+            "unit_hydrograph_data": tables[1],
+            "runoff_results_table": tables[2],
+            "hydrograph_ordinates_table": tables[3]
+        }
+        if request_body.returnCumulativeRunoff:
+            response_content["cumulative_runoff_table"] = tables[4]
+        return response_content
+
+    except Exception as e:
+        raise HTTPException(status_code = 500, detail =  str(e))
+
+# Returns the storm hydrographs of every AEP and D-hour storm from a single NOAA request, as nested lists indexed by AEP, D-hour storm, and time
+# AEPs whose Curve Number cannot be adjusted for a rainfall duration have null results and a message in runoff_results_table["errors"]
+@app.post("/scsyntheticunithydrographallaeps/")
+async def scsyntheticunithydrographallaeps(request_body: SCSyntheticUnitHydrographAllAEPs, response: Response):
+
+    try: 
+        rainfall_depths = request_body.rainfallDepths
+        if rainfall_depths is None:
+            rainfall_depths = rainfallDepthMatrix(await rainfallDataAsync(request_body.lat, request_body.lon))
+        tables = await run_in_threadpool(
+            computeSCSyntheticUnitHydrographAllAEPs,
+            request_body.lat,
+            request_body.lon,
+            request_body.CNModificationMethod,
+            request_body.Area,
+            request_body.Tc,
+            request_body.RainfallDistributionCurve,
+            request_body.PRF,
+            request_body.CN,
+            request_body.S,
+            request_body.Ia,
+            rainfall_depths
+        )
+        # NaN (results of AEPs listed in "errors") is not valid JSON, so it is returned as null
+        watershed_data, unit_hydrograph_data, runoff_results_table, hydrograph_ordinates_table = [
+            {key: np.where(np.isnan(value), None, value).tolist() if isinstance(value, np.ndarray) else value for key, value in table.items()}
+            for table in tables
+        ]
         return {
             "watershed_data": watershed_data,
             "unit_hydrograph_data": unit_hydrograph_data,
@@ -850,10 +965,16 @@ def scsyntheticunithydrograph(request_body: SCSyntheticUnitHydrograph, response:
         raise HTTPException(status_code = 500, detail =  str(e))
 
 @app.post("/calculatemissingparametersSCSUH/")
-def calculatemissingparametersSCSUH(request_body: CalculateMissingParametersSCSUH, response: Response):
+async def calculatemissingparametersSCSUH(request_body: CalculateMissingParametersSCSUH, response: Response):
 
     try: 
-        rainfall_distribution_curve_letter, Tc, PRF, CN, S, Ia = calculateMissingParametersSCSUH(
+        # Request the rainfall distribution curve and rainfall data concurrently, then compute the remaining parameters in the threadpool
+        rainfall_distribution_curve, rainfall_data = await asyncio.gather(
+            rainfallDistributionCurveAsync(request_body.lat, request_body.lon),
+            rainfallDataAsync(request_body.lat, request_body.lon)
+        )
+        rainfall_distribution_curve_letter, Tc, PRF, CN, S, Ia, rainfall_depths = await run_in_threadpool(
+            calculateMissingParametersSCSUH,
             request_body.lat,
             request_body.lon,
             request_body.watershedFeatures,
@@ -869,6 +990,8 @@ def calculatemissingparametersSCSUH(request_body: CalculateMissingParametersSCSU
             request_body.dataChannelizedFlowOpenChannel,
             request_body.dataChannelizedFlowStormSewer,
             request_body.dataChannelizedFlowStormSewerOrOpenChannelUserInputVelocity,
+            rainfall_distribution_curve=rainfall_distribution_curve,
+            rainfall_data=rainfall_data
         )
         return {
             "rainfall_distribution_curve_letter": rainfall_distribution_curve_letter,
@@ -876,7 +999,8 @@ def calculatemissingparametersSCSUH(request_body: CalculateMissingParametersSCSU
             "peak_rate_factor": PRF,
             "curve_number": CN,
             "S": S,
-            "Ia": Ia
+            "Ia": Ia,
+            "rainfall_depths": rainfall_depths
         }
 
     except Exception as e:
@@ -925,7 +1049,8 @@ def stormponds(request_body: calculateStormPonds = Body(examples=calculateStormP
             request_body.w2,
             request_body.side_slope_z,
             request_body.bottom_slope,
-            request_body.Elev_Area
+            request_body.Elev_Area,
+            request_body.rainfallDepths
         )
         return {
             "runoff_and_ponding_results": runoff_and_ponding_results,